@@ -1,7 +1,8 @@
 import os
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import numpy as np
 import pandas as pd
@@ -12,6 +13,11 @@ import pandas as pd
 START_DATE = datetime(2024, 1, 1)
 END_DATE = datetime(2025, 6, 30)  # 18 months
 
+# Same bounds as int64 nanoseconds, for vectorized date arithmetic
+START_NS = pd.Timestamp(START_DATE).value
+END_NS = pd.Timestamp(END_DATE).value
+DAY_NS = pd.Timedelta(days=1).value
+
 NUM_CREATORS = 20
 NUM_FANS = 1000
 
@@ -24,206 +30,249 @@ DB_PATH = DATA_DIR / DB_NAME
 
 # IMPORTANT: schema.sql is expected to be in the project root (same folder as this script)
 SCHEMA_PATH = BASE_DIR / "schema.sql"
+# Indexes are created only after the bulk load
+SCHEMA_INDEXES_PATH = BASE_DIR / "schema_indexes.sql"
 
-# Performance knobs (so it doesn’t run forever)
-# Reduces amount of content scanned per fan by sampling content per creator
-MAX_CONTENT_PER_CREATOR_PER_FAN = 120  # lower = faster, higher = more events
+# Engagement model
+# Expected number of items a fan sees per creator: engagement probability is thinned by
+# min(1, MAX_CONTENT_PER_CREATOR_PER_FAN / catalogue size), so larger catalogues don't scale events
+MAX_CONTENT_PER_CREATOR_PER_FAN = 120  # lower = fewer events on large catalogues, not faster
 BASE_ENGAGEMENT_RATE = 0.005
+# Engagement probability multiplier per membership tier
+TIER_ENGAGEMENT_MULT = {"Bronze": 1.0, "Silver": 1.2, "Gold": 1.5, "Platinum": 2.0}
+
+# Performance knob: max (membership, content) candidates expanded at once while streaming engagement events
+ENGAGEMENT_BATCH_SIZE = 50_000
+
+# Default generator for the generate_* functions; set SEED to get a different dataset
+RNG = np.random.default_rng(int(os.environ.get("SEED", 0)))
+
+# Dates are kept as datetime64 columns while generating and only
+# formatted to SQLite text when saved
+DATE_COLUMNS = {"join_date", "signup_date", "start_date", "end_date"}
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 
 # -----------------------------
 # Helper functions
 # -----------------------------
-def get_random_date(start: datetime, end: datetime) -> datetime:
-    """Generate a random datetime between start and end."""
-    return start + (end - start) * np.random.random()
+def random_dates_ns(lo, hi, size: int, rng: np.random.Generator = RNG) -> pd.DatetimeIndex:
+    """Generate `size` random datetimes between int64-ns bounds lo and hi (scalars or arrays)."""
+    return pd.to_datetime(lo + (rng.random(size) * (hi - lo)).astype("int64"))
 
 
-def generate_creators() -> pd.DataFrame:
-    categories = ["Gaming", "Education", "Art", "Music", "Vlogging", "Cooking", "Fitness"]
-    creator_data = []
-    for i in range(1, NUM_CREATORS + 1):
-        join_date = get_random_date(START_DATE, START_DATE + timedelta(days=365))
-        creator_data.append(
-            {
-                "creator_id": i,
-                "category": np.random.choice(categories, p=[0.2, 0.2, 0.15, 0.15, 0.1, 0.1, 0.1]),
-                "join_date": join_date.strftime("%Y-%m-%d"),
-            }
-        )
-    return pd.DataFrame(creator_data)
-
-
-def generate_fans() -> pd.DataFrame:
-    countries = ["USA", "CAN", "GBR", "AUS", "DEU", "FRA", "JPN", "IND"]
-    fan_data = []
-    for i in range(1, NUM_FANS + 1):
-        signup_date = get_random_date(START_DATE, END_DATE)
-        fan_data.append(
-            {
-                "fan_id": i,
-                "signup_date": signup_date.strftime("%Y-%m-%d"),
-                "country": np.random.choice(countries, p=[0.3, 0.1, 0.15, 0.05, 0.1, 0.05, 0.05, 0.2]),
-            }
-        )
-    return pd.DataFrame(fan_data)
+def random_categories(categories, size: int, p, rng: np.random.Generator = RNG) -> pd.Categorical:
+    """Draw `size` labels with probabilities p, stored as int8 codes into `categories`."""
+    codes = rng.choice(len(categories), size=size, p=p).astype(np.int8)
+    return pd.Categorical.from_codes(codes, categories=categories)
 
 
-def generate_content(creators_df: pd.DataFrame) -> pd.DataFrame:
-    content_types = ["video", "post", "livestream"]
-    content_data = []
-    content_id = 1
-
-    for _, creator in creators_df.iterrows():
-        join_dt = datetime.strptime(creator["join_date"], "%Y-%m-%d")
-        num_content = np.random.randint(50, 200)
-
-        for _ in range(num_content):
-            publish_date = get_random_date(join_dt, END_DATE)
-            content_data.append(
-                {
-                    "content_id": content_id,
-                    "creator_id": int(creator["creator_id"]),
-                    "content_type": np.random.choice(content_types, p=[0.5, 0.3, 0.2]),
-                    "publish_date": publish_date.strftime("%Y-%m-%d %H:%M:%S"),
-                }
-            )
-            content_id += 1
-
-    df = pd.DataFrame(content_data)
-    return df
+def to_ns(dates) -> np.ndarray:
+    """View a datetime-like column as int64 nanoseconds since the epoch."""
+    return pd.to_datetime(dates).to_numpy(dtype="datetime64[ns]").view("int64")
 
 
-def generate_memberships(fans_df: pd.DataFrame, creators_df: pd.DataFrame) -> pd.DataFrame:
-    tiers = {"Bronze": 5.00, "Silver": 10.00, "Gold": 20.00, "Platinum": 50.00}
-    tier_names = list(tiers.keys())
+def generate_creators(rng: np.random.Generator = RNG) -> pd.DataFrame:
+    categories = ["Gaming", "Education", "Art", "Music", "Vlogging", "Cooking", "Fitness"]
+    return pd.DataFrame(
+        {
+            "creator_id": np.arange(1, NUM_CREATORS + 1, dtype=np.int32),
+            "category": random_categories(categories, NUM_CREATORS, [0.2, 0.2, 0.15, 0.15, 0.1, 0.1, 0.1], rng),
+            "join_date": random_dates_ns(START_NS, START_NS + 365 * DAY_NS, NUM_CREATORS, rng).floor("D"),
+        }
+    )
 
-    membership_data = []
-    membership_id = 1
 
-    creators = creators_df["creator_id"].unique()
+def generate_fans(rng: np.random.Generator = RNG) -> pd.DataFrame:
+    countries = ["USA", "CAN", "GBR", "AUS", "DEU", "FRA", "JPN", "IND"]
+    return pd.DataFrame(
+        {
+            "fan_id": np.arange(1, NUM_FANS + 1, dtype=np.int32),
+            "signup_date": random_dates_ns(START_NS, END_NS, NUM_FANS, rng).floor("D"),
+            "country": random_categories(countries, NUM_FANS, [0.3, 0.1, 0.15, 0.05, 0.1, 0.05, 0.05, 0.2], rng),
+        }
+    )
 
-    for _, fan in fans_df.iterrows():
-        num_creators_supported = np.random.choice([0, 1, 2, 3], p=[0.5, 0.3, 0.15, 0.05])
-        if num_creators_supported == 0:
-            continue
 
-        supported_creators = np.random.choice(creators, num_creators_supported, replace=False)
+def generate_content(creators_df: pd.DataFrame, rng: np.random.Generator = RNG) -> pd.DataFrame:
+    content_types = ["video", "post", "livestream"]
 
-        fan_signup = datetime.strptime(fan["signup_date"], "%Y-%m-%d")
+    # Draw every creator's content count up front, then build whole columns at once
+    counts = rng.integers(50, 200, len(creators_df))
+    total = int(counts.sum())
 
-        for creator_id in supported_creators:
-            creator_join = datetime.strptime(
-                creators_df.loc[creators_df["creator_id"] == creator_id, "join_date"].iloc[0],
-                "%Y-%m-%d",
-            )
-            start_date_min = max(fan_signup, creator_join)
+    creator_ids = np.repeat(creators_df["creator_id"].to_numpy(dtype=np.int32), counts)
 
-            latest_start = END_DATE - timedelta(days=30)
-            if start_date_min >= latest_start:
-                continue
+    # Publish dates are uniform between each creator's join date and END_DATE
+    publish_dates = random_dates_ns(np.repeat(to_ns(creators_df["join_date"]), counts), END_NS, total, rng)
 
-            start_date = get_random_date(start_date_min, latest_start)
+    return pd.DataFrame(
+        {
+            "content_id": np.arange(1, total + 1, dtype=np.int32),
+            "creator_id": creator_ids,
+            "content_type": random_categories(content_types, total, [0.5, 0.3, 0.2], rng),
+            "publish_date": publish_dates,
+        }
+    )
 
-            tier_name = np.random.choice(tier_names, p=[0.4, 0.3, 0.2, 0.1])
-            monthly_price = tiers[tier_name]
 
-            is_active = np.random.choice([True, False], p=[0.6, 0.4])
-            end_date = None
-            if not is_active:
-                min_churn_date = start_date + timedelta(days=30)
-                if min_churn_date < END_DATE:
-                    end_date = get_random_date(min_churn_date, END_DATE).strftime("%Y-%m-%d")
+def generate_memberships(
+    fans_df: pd.DataFrame,
+    creators_df: pd.DataFrame,
+    rng: np.random.Generator = RNG,
+) -> pd.DataFrame:
+    tiers = {"Bronze": 5.00, "Silver": 10.00, "Gold": 20.00, "Platinum": 50.00}
+    tier_names = list(tiers.keys())
+    tier_prices = np.array(list(tiers.values()))
+
+    creator_ids = creators_df["creator_id"].to_numpy(dtype=np.int32)
+    creator_join_ns = to_ns(creators_df["join_date"])
+    fan_ids = fans_df["fan_id"].to_numpy(dtype=np.int32)
+    fan_signup_ns = to_ns(fans_df["signup_date"])
+
+    # Number of creators each fan supports, then that many distinct creators per fan:
+    # the k smallest of a row of uniform keys is a uniform sample without replacement.
+    num_supported = rng.choice([0, 1, 2, 3], size=len(fans_df), p=[0.5, 0.3, 0.15, 0.05])
+    max_supported = max(int(num_supported.max()), 1)
+    keys = rng.random((len(fans_df), len(creators_df)))
+    picks = np.argpartition(keys, max_supported - 1, axis=1)[:, :max_supported]
+    fan_pos, slot = np.nonzero(np.arange(max_supported) < num_supported[:, None])
+    creator_pos = picks[fan_pos, slot]
+
+    # Memberships can start once both the fan and the creator exist,
+    # and no later than 30 days before END_DATE
+    latest_start = END_NS - 30 * DAY_NS
+    start_min = np.maximum(fan_signup_ns[fan_pos], creator_join_ns[creator_pos])
+    keep = start_min < latest_start
+    fan_pos, creator_pos, start_min = fan_pos[keep], creator_pos[keep], start_min[keep]
+    n = len(start_min)
+
+    start_dates = random_dates_ns(start_min, latest_start, n, rng)
+
+    tier = random_categories(tier_names, n, [0.4, 0.3, 0.2, 0.1], rng)
+
+    # 40% of memberships churn, at least 30 days after they started
+    is_active = rng.random(n) < 0.6
+    min_churn = start_dates.asi8 + 30 * DAY_NS
+    churned = ~is_active & (min_churn < END_NS)
+    end_dates = random_dates_ns(min_churn, END_NS, n, rng).where(churned)
+
+    return pd.DataFrame(
+        {
+            "membership_id": np.arange(1, n + 1, dtype=np.int32),
+            "fan_id": fan_ids[fan_pos],
+            "creator_id": creator_ids[creator_pos],
+            "tier": tier,
+            "monthly_price": tier_prices[tier.codes],
+            "start_date": start_dates.floor("D"),
+            "end_date": end_dates.floor("D"),
+        }
+    )
+
+
+def draw_events(
+    fan_ids: np.ndarray,
+    content_ids: np.ndarray,
+    publish_ns: np.ndarray,
+    engagement_prob: np.ndarray,
+    rng: np.random.Generator = RNG,
+):
+    """
+    Draws engagement events for candidate (fan, content) pairs given as parallel arrays.
+    Returns typed (fan_ids, content_ids, event_ns, event_type_idx) columns, one entry per event;
+    event types are int8 codes decoded only when the final frame is built.
+    """
+    hot = np.flatnonzero(rng.random(len(engagement_prob)) < engagement_prob)
 
-            membership_data.append(
-                {
-                    "membership_id": membership_id,
-                    "fan_id": int(fan["fan_id"]),
-                    "creator_id": int(creator_id),
-                    "tier": tier_name,
-                    "monthly_price": float(monthly_price),
-                    "start_date": start_date.strftime("%Y-%m-%d"),
-                    "end_date": end_date,
-                }
-            )
-            membership_id += 1
+    # Each engaged (fan, content) pair produces 1-3 events within a week of publishing
+    idx = np.repeat(hot, rng.integers(1, 4, len(hot)))
+    hour_ns = pd.Timedelta(hours=1).value
+    event_ns = publish_ns[idx] + rng.integers(1, 168, len(idx)) * hour_ns
 
-    return pd.DataFrame(membership_data)
+    return fan_ids[idx], content_ids[idx], event_ns, rng.integers(0, 3, len(idx), dtype=np.int8)
 
 
 def generate_engagement_events(
     content_df: pd.DataFrame,
     memberships_df: pd.DataFrame,
-) -> pd.DataFrame:
+    rng: np.random.Generator = RNG,
+    batch_size: int = ENGAGEMENT_BATCH_SIZE,
+) -> Iterator[pd.DataFrame]:
     """
     Generates engagement events for members interacting with content from creators they support.
-    This version is faster and avoids scanning *all* content for each fan.
+    Candidate (membership, content) pairs are found with searchsorted over per-creator blocks of
+    time-sorted content, then drawn in vectorized batches of about `batch_size` candidates.
+    Yields one DataFrame of events per batch so the full table never has to sit in memory.
     """
     event_types = ["view", "like", "comment"]
-    engagement_rows = []
-    event_id = 1
-
-    # Prepare datetimes
-    content = content_df.copy()
-    content["publish_dt"] = pd.to_datetime(content["publish_date"])
 
-    memberships = memberships_df.copy()
-    memberships["start_dt"] = pd.to_datetime(memberships["start_date"])
-    memberships["end_dt"] = pd.to_datetime(memberships["end_date"]).fillna(pd.Timestamp(END_DATE))
-
-    # Index content by creator_id for fast sampling
+    # Content sorted by (creator, publish time): each creator's catalogue is one contiguous block
+    content_creator = content_df["creator_id"].to_numpy()
+    content_ns = to_ns(content_df["publish_date"])
+    order = np.lexsort((content_ns, content_creator))
+    content_creator, content_ns = content_creator[order], content_ns[order]
+    content_ids = content_df["content_id"].to_numpy()[order]
+    creator_keys, block_starts, block_sizes = np.unique(content_creator, return_index=True, return_counts=True)
     content_by_creator = {
-        cid: grp for cid, grp in content.groupby("creator_id", sort=False)
+        creator_id: (start, content_ns[start:start + size])
+        for creator_id, start, size in zip(creator_keys, block_starts, block_sizes)
     }
 
-    # Group memberships by fan
-    for fan_id, fan_memberships in memberships.groupby("fan_id", sort=False):
-        for _, m in fan_memberships.iterrows():
-            creator_id = int(m["creator_id"])
-            creator_content = content_by_creator.get(creator_id)
-            if creator_content is None or creator_content.empty:
-                continue
-
-            # Sample content for speed
-            if len(creator_content) > MAX_CONTENT_PER_CREATOR_PER_FAN:
-                sampled = creator_content.sample(MAX_CONTENT_PER_CREATOR_PER_FAN, random_state=None)
-            else:
-                sampled = creator_content
-
-            # Filter to content during membership window
-            window_content = sampled[
-                (sampled["publish_dt"] >= m["start_dt"]) & (sampled["publish_dt"] <= m["end_dt"])
-            ]
-            if window_content.empty:
-                continue
-
-            # Tier affects probability
-            engagement_prob = BASE_ENGAGEMENT_RATE * 5.0
-            tier = m["tier"]
-            if tier == "Silver":
-                engagement_prob *= 1.2
-            elif tier == "Gold":
-                engagement_prob *= 1.5
-            elif tier == "Platinum":
-                engagement_prob *= 2.0
-
-            for _, c in window_content.iterrows():
-                if np.random.rand() < engagement_prob:
-                    num_events = np.random.randint(1, 4)
-                    for _ in range(num_events):
-                        event_date = c["publish_dt"] + timedelta(hours=int(np.random.randint(1, 168)))
-                        engagement_rows.append(
-                            {
-                                "event_id": event_id,
-                                "fan_id": int(fan_id),
-                                "content_id": int(c["content_id"]),
-                                "event_type": np.random.choice(event_types),
-                                "event_date": event_date.strftime("%Y-%m-%d %H:%M:%S"),
-                            }
-                        )
-                        event_id += 1
-
-    return pd.DataFrame(engagement_rows)
+    membership_creator = memberships_df["creator_id"].to_numpy()
+    start_ns = to_ns(memberships_df["start_date"])
+    end_ns = to_ns(memberships_df["end_date"].fillna(pd.Timestamp(END_DATE)))
+
+    # Locate each membership's window [start, end] inside its creator's block
+    n = len(memberships_df)
+    lo = np.zeros(n, dtype=np.int64)
+    hi = np.zeros(n, dtype=np.int64)
+    catalogue_size = np.ones(n)
+    for creator_id, (block_start, block_ns) in content_by_creator.items():
+        rows = np.flatnonzero(membership_creator == creator_id)
+        lo[rows] = block_start + np.searchsorted(block_ns, start_ns[rows], side="left")
+        hi[rows] = block_start + np.searchsorted(block_ns, end_ns[rows], side="right")
+        catalogue_size[rows] = len(block_ns)
+
+    # Tier affects probability
+    engagement_prob = (
+        BASE_ENGAGEMENT_RATE * 5.0 * memberships_df["tier"].map(TIER_ENGAGEMENT_MULT).to_numpy(dtype=float)
+    )
+    # Every in-window item is a candidate; a fan is expected to see only MAX_CONTENT_PER_CREATOR_PER_FAN
+    # of a large catalogue, so each item's probability is thinned by that share
+    engagement_prob *= np.minimum(1.0, MAX_CONTENT_PER_CREATOR_PER_FAN / catalogue_size)
+
+    # Split memberships into batches by how many candidates precede them
+    pair_counts = hi - lo
+    batch_ids = (np.cumsum(pair_counts) - pair_counts) // batch_size
+    batches = np.split(np.arange(n), np.flatnonzero(np.diff(batch_ids)) + 1)
+
+    fan_ids = memberships_df["fan_id"].to_numpy()
+    next_event_id = 1
+    for rows in batches:
+        # Expand to one candidate per (membership, content published during the membership)
+        counts = pair_counts[rows]
+        membership_idx = np.repeat(rows, counts)
+        content_pos = np.arange(counts.sum()) + np.repeat(lo[rows] - (np.cumsum(counts) - counts), counts)
+
+        event_fan_ids, event_content_ids, event_ns, event_type_idx = draw_events(
+            fan_ids[membership_idx],
+            content_ids[content_pos],
+            content_ns[content_pos],
+            engagement_prob[membership_idx],
+            rng,
+        )
+
+        yield pd.DataFrame(
+            {
+                "event_id": np.arange(next_event_id, next_event_id + len(event_ns), dtype=np.int32),
+                "fan_id": event_fan_ids,
+                "content_id": event_content_ids,
+                "event_type": pd.Categorical.from_codes(event_type_idx, categories=event_types),
+                "event_date": pd.to_datetime(event_ns),
+            }
+        )
+        next_event_id += len(event_ns)
 
 
 def create_db_and_tables(conn: sqlite3.Connection) -> None:
@@ -241,12 +290,63 @@ def create_db_and_tables(conn: sqlite3.Connection) -> None:
     print("Tables created successfully.")
 
 
+def create_indexes(conn: sqlite3.Connection) -> None:
+    """Creates indexes and refreshes planner statistics using schema_indexes.sql."""
+    if not SCHEMA_INDEXES_PATH.exists():
+        raise FileNotFoundError(
+            f"schema_indexes.sql not found at: {SCHEMA_INDEXES_PATH}\n"
+            f"Place schema_indexes.sql in the same folder as generate_data.py."
+        )
+
+    print("Creating indexes...")
+    conn.executescript(SCHEMA_INDEXES_PATH.read_text(encoding="utf-8"))
+    print("Indexes created successfully.")
+
+
+def format_dates(df: pd.DataFrame) -> pd.DataFrame:
+    """Formats datetime64 columns as the ISO text SQLite stores (NaT becomes NULL)."""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            fmt = DATE_FORMAT if col in DATE_COLUMNS else DATETIME_FORMAT
+            df[col] = df[col].dt.strftime(fmt)
+    return df
+
+
+def insert_rows(df: pd.DataFrame, table_name: str, conn: sqlite3.Connection) -> None:
+    """Inserts a frame with one executemany; the caller owns the transaction."""
+    df = format_dates(df)
+    # Plain Python values for sqlite3 binding, with missing values as NULL
+    df = df.astype(object).where(df.notna(), None)
+
+    cols = ", ".join(df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    conn.executemany(
+        f"INSERT INTO {table_name} ({cols}) VALUES ({placeholders})",
+        df.itertuples(index=False, name=None),
+    )
+
+
 def save_to_sql(df: pd.DataFrame, table_name: str, conn: sqlite3.Connection) -> None:
     print(f"Saving {len(df)} records to {table_name}...")
-    df.to_sql(table_name, conn, if_exists="append", index=False)
+    conn.execute("BEGIN")
+    insert_rows(df, table_name, conn)
+    conn.execute("COMMIT")
     print(f"Finished saving {table_name}.")
 
 
+def save_batches_to_sql(batches: Iterable[pd.DataFrame], table_name: str, conn: sqlite3.Connection) -> None:
+    """Streams batches into one table inside a single transaction."""
+    print(f"Saving {table_name} in batches...")
+    total = 0
+    conn.execute("BEGIN")
+    for df in batches:
+        insert_rows(df, table_name, conn)
+        total += len(df)
+    conn.execute("COMMIT")
+    print(f"Finished saving {total} records to {table_name}.")
+
+
 def main() -> None:
     print("Starting data generation...")
 
@@ -257,7 +357,13 @@ def main() -> None:
     if DB_PATH.exists():
         DB_PATH.unlink()
 
-    conn = sqlite3.connect(str(DB_PATH))
+    # Autocommit mode: save_to_sql manages its own transactions
+    conn = sqlite3.connect(str(DB_PATH), isolation_level=None)
+
+    # The DB is rebuilt from scratch on every run, so durability can be traded for speed
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA temp_store = MEMORY")
 
     try:
         # Create tables
@@ -269,15 +375,17 @@ def main() -> None:
         content_df = generate_content(creators_df)
         memberships_df = generate_memberships(fans_df, creators_df)
 
-        # Generate engagement
-        engagement_df = generate_engagement_events(content_df, memberships_df)
-
         # Save to DB
         save_to_sql(creators_df, "creators", conn)
         save_to_sql(fans_df, "fans", conn)
         save_to_sql(content_df, "content", conn)
         save_to_sql(memberships_df, "memberships", conn)
-        save_to_sql(engagement_df, "engagement_events", conn)
+
+        # Generate engagement, streamed into the DB batch by batch
+        save_batches_to_sql(generate_engagement_events(content_df, memberships_df), "engagement_events", conn)
+
+        # Index once everything is loaded
+        create_indexes(conn)
 
         print(f"✅ Data generation complete. Database created at: {DB_PATH}")
 
@@ -32,6 +32,7 @@ def main():
     analytics = CreatorAnalytics(str(DB_PATH))
 
     print("Generating visualizations...")
+    h.setup_plotting_style()
 
     # 1) Monthly Active Supporters
     mas_df = analytics.get_monthly_active_supporters()
@@ -1,10 +1,19 @@
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # plots are only ever saved to files
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
+# One figure is reused for every plot instead of creating and tearing down a new one each time
+_FIGURE = None
+
 def setup_plotting_style():
-    """Sets up a clean, professional plotting style."""
+    """Sets up a clean, professional plotting style. Call once before plotting."""
+    if getattr(setup_plotting_style, '_done', False):
+        return
+    setup_plotting_style._done = True
     sns.set_theme(style="whitegrid")
     plt.rcParams['figure.figsize'] = (10, 6)
     plt.rcParams['axes.titlesize'] = 16
@@ -15,25 +24,34 @@ def setup_plotting_style():
     plt.rcParams['grid.linestyle'] = '--'
     plt.rcParams['grid.alpha'] = 0.6
 
+def get_figure(figsize=None):
+    """Returns the shared figure, cleared and resized, with a single fresh axes."""
+    global _FIGURE
+    if _FIGURE is None or not plt.fignum_exists(_FIGURE.number):
+        _FIGURE = plt.figure()
+    _FIGURE.clear()
+    _FIGURE.set_size_inches(figsize or plt.rcParams['figure.figsize'])
+    return _FIGURE, _FIGURE.add_subplot(111)
+
 def save_plot(fig, filename, path="/home/ubuntu/creator_analytics_project/notebooks/images"):
     """Saves a matplotlib figure to a specified path."""
     if not os.path.exists(path):
         os.makedirs(path)
     full_path = os.path.join(path, filename)
     fig.savefig(full_path, bbox_inches='tight', dpi=300)
-    plt.close(fig)
+    if fig is not _FIGURE:
+        plt.close(fig)
     print(f"Plot saved to {full_path}")
     return full_path
 
 def plot_time_series(df, x_col, y_col, title, ylabel, filename):
     """Generates and saves a simple time series plot."""
-    setup_plotting_style()
-    fig, ax = plt.subplots()
+    fig, ax = get_figure()
     
     # Ensure x_col is datetime for proper plotting
     df[x_col] = pd.to_datetime(df[x_col])
     
-    sns.lineplot(x=x_col, y=y_col, data=df, ax=ax, marker='o')
+    ax.plot(df[x_col].values, df[y_col].values, marker='o')
     
     ax.set_title(title)
     ax.set_xlabel("Month")
@@ -44,8 +62,7 @@ def plot_time_series(df, x_col, y_col, title, ylabel, filename):
 
 def plot_bar_chart(df, x_col, y_col, title, xlabel, ylabel, filename):
     """Generates and saves a simple bar chart."""
-    setup_plotting_style()
-    fig, ax = plt.subplots()
+    fig, ax = get_figure()
     
     sns.barplot(x=x_col, y=y_col, data=df, ax=ax, palette="viridis")
     
@@ -58,13 +75,13 @@ def plot_bar_chart(df, x_col, y_col, title, xlabel, ylabel, filename):
 
 def plot_segmented_time_series(df, x_col, y_col, segment_col, title, ylabel, filename):
     """Generates and saves a segmented time series plot."""
-    setup_plotting_style()
-    fig, ax = plt.subplots()
+    fig, ax = get_figure()
     
     # Ensure x_col is datetime for proper plotting
     df[x_col] = pd.to_datetime(df[x_col])
     
-    sns.lineplot(x=x_col, y=y_col, hue=segment_col, data=df, ax=ax, marker='o')
+    for segment, segment_df in df.groupby(segment_col):
+        ax.plot(segment_df[x_col].values, segment_df[y_col].values, marker='o', label=segment)
     
     ax.set_title(title)
     ax.set_xlabel("Month")
@@ -76,15 +93,13 @@ def plot_segmented_time_series(df, x_col, y_col, segment_col, title, ylabel, fil
 
 def plot_retention_heatmap(retention_df, title, filename):
     """Generates and saves a heatmap for cohort retention analysis."""
-    setup_plotting_style()
-    
     # Pivot the data for heatmap
     retention_pivot = retention_df.pivot(index='cohort_month', columns='month_number', values='retention_rate_pct')
     
     # Rename columns to be more descriptive
     retention_pivot.columns = [f'Month {i}' for i in retention_pivot.columns]
     
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig, ax = get_figure(figsize=(12, 8))
     sns.heatmap(
         retention_pivot,
         annot=True,
@@ -105,50 +120,54 @@ def plot_retention_heatmap(retention_df, title, filename):
 def calculate_cohort_retention(memberships_df):
     """
     Calculates cohort retention using Pandas for robust date handling.
+    Months are handled as integer period ordinals so every groupby runs on int64 keys.
     """
     # 1. Determine the cohort (start month) for each membership
     memberships_df['start_date'] = pd.to_datetime(memberships_df['start_date'])
     memberships_df['cohort_month'] = memberships_df['start_date'].dt.to_period('M')
+    memberships_df['cohort_ord'] = memberships_df['cohort_month'].astype('int64')
     
     # 2. Calculate the total number of members in each cohort (Cohort Size)
-    cohort_sizes = memberships_df.groupby('cohort_month')['fan_id'].nunique().reset_index()
-    cohort_sizes.rename(columns={'fan_id': 'cohort_size'}, inplace=True)
-    
-    # 3. Create a list of all active months for each membership
-    all_active_months = []
-    for _, row in memberships_df.iterrows():
-        end_date = pd.to_datetime(row['end_date']) if row['end_date'] else pd.to_datetime('2025-06-30')
-        start_date = pd.to_datetime(row['start_date'])
-        
-        if end_date >= start_date:
-            months = pd.date_range(start=start_date, end=end_date, freq='MS').to_period('M')
-            for m in months:
-                all_active_months.append({
-                    'fan_id': row['fan_id'],
-                    'cohort_month': row['cohort_month'],
-                    'active_month': m
-                })
-    
-    membership_months = pd.DataFrame(all_active_months)
+    cohort_sizes = (
+        memberships_df.drop_duplicates(subset=['fan_id', 'cohort_ord'])
+        .groupby('cohort_ord').size().reset_index(name='cohort_size')
+    )
     
-    # Drop duplicates to count unique fans per month
-    membership_months = membership_months.drop_duplicates(subset=['fan_id', 'active_month'])
+    # 3. Expand each membership into one row per active month (start month through end month),
+    #    working on integer period ordinals instead of building a date range per row
+    end_dates = pd.to_datetime(memberships_df['end_date']).fillna(pd.Timestamp('2025-06-30'))
+    start_p = memberships_df['cohort_ord'].to_numpy()
+    end_p = end_dates.dt.to_period('M').astype('int64').to_numpy()
+    month_counts = np.clip(end_p - start_p + 1, 0, None)
+    
+    cohort_rep = np.repeat(start_p, month_counts)
+    offsets = np.arange(month_counts.sum()) - np.repeat(np.cumsum(month_counts) - month_counts, month_counts)
+    
+    membership_months = pd.DataFrame({
+        'fan_id': np.repeat(memberships_df['fan_id'].to_numpy(), month_counts),
+        'cohort_ord': cohort_rep,
+        'active_ord': cohort_rep + offsets,
+        # 4. The month number relative to the cohort month is the offset itself,
+        #    since consecutive monthly periods differ by exactly 1
+        'month_number': offsets,
+    })
     
-    # 4. Calculate the month number relative to the cohort month
-    membership_months['month_number'] = (
-        membership_months['active_month'].dt.to_timestamp() - 
-        membership_months['cohort_month'].dt.to_timestamp()
-    ).apply(lambda x: x.days // 30).astype(int)
+    # Drop duplicates to count unique fans per month
+    membership_months = membership_months.drop_duplicates(subset=['fan_id', 'active_ord'])
     
-    # 5. Count the number of retained fans per cohort and month number
-    retention_counts = membership_months.groupby(['cohort_month', 'month_number'])['fan_id'].nunique().reset_index()
-    retention_counts.rename(columns={'fan_id': 'retained_fans'}, inplace=True)
+    # 5. Count the number of retained fans per cohort and month number. A (cohort, month number)
+    #    pair fixes the active month, which is already unique per fan, so a row count suffices
+    retention_counts = (
+        membership_months.groupby(['cohort_ord', 'month_number']).size().reset_index(name='retained_fans')
+    )
     
     # 6. Merge with cohort size and calculate retention rate
-    retention_df = pd.merge(retention_counts, cohort_sizes, on='cohort_month')
+    retention_df = pd.merge(retention_counts, cohort_sizes, on='cohort_ord')
     retention_df['retention_rate_pct'] = (retention_df['retained_fans'] / retention_df['cohort_size']) * 100
     
     # Format cohort_month for display
-    retention_df['cohort_month'] = retention_df['cohort_month'].astype(str)
+    retention_df.insert(
+        0, 'cohort_month', pd.PeriodIndex.from_ordinals(retention_df.pop('cohort_ord'), freq='M').astype(str)
+    )
     
     return retention_df
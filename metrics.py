@@ -1,9 +1,18 @@
 import os
 import sqlite3
+from pathlib import Path
 from datetime import datetime
 import numpy as np
 import pandas as pd
 
+# Rows fetched per read_sql_query chunk, to cap peak memory on large results
+READ_CHUNKSIZE = 50_000
+
+# Reporting window (first and last month start) and the snapshot date used for open memberships
+REPORT_START = "2024-01-01"
+REPORT_END = "2025-06-01"
+SNAPSHOT_DATE = "2025-06-30"
+
 
 class CreatorAnalytics:
     """
@@ -20,86 +29,172 @@ class CreatorAnalytics:
                 f"Make sure you ran generate_data.py and that the DB exists at ./data/creator_analytics.db"
             )
 
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row
+        # Reporting months, loaded into a temp table on the connection (see _connect)
+        self._months = pd.date_range(REPORT_START, REPORT_END, freq="MS")
+        self._db_version = self._db_file_version()
+        self.conn = self._connect()
+
+        # Cached month x membership panel (see _load_membership_panel)
+        self._panel = None
+        self._mas_arpm = None
 
     def __del__(self):
-        # Avoid error if init failed before creating self.conn
+        # Avoid error if init failed before conn was created
         if hasattr(self, "conn"):
             try:
                 self.conn.close()
             except Exception:
                 pass
 
+    def _connect(self):
+        # Read-only: the metrics never write to the DB file (temp tables live in temp_store)
+        conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True)
+        # No row_factory: read_sql_query builds frames from plain tuples, the cheapest row type
+
+        # Read-side tuning: 64 MiB page cache, memory-mapped reads, in-memory temp tables
+        conn.execute("PRAGMA cache_size = -65536;")
+        conn.execute("PRAGMA mmap_size = 268435456;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+
+        # Reporting months, built once in Python instead of by a recursive CTE in every query
+        conn.execute("CREATE TEMP TABLE _months (month_start TEXT PRIMARY KEY);")
+        self._bulk_insert_temp(
+            conn, "_months", ["month_start"], [(d.strftime("%Y-%m-%d"),) for d in self._months]
+        )
+        return conn
+
+    @staticmethod
+    def _bulk_insert_temp(conn, table, cols, rows):
+        """Inserts rows into a temp table with one executemany inside a single transaction."""
+        placeholders = ", ".join("?" * len(cols))
+        with conn:
+            conn.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({placeholders});", rows)
+
+    def _db_file_version(self):
+        # Inode catches the file being deleted and recreated (generate_data.py), mtime/size in-place writes
+        st = os.stat(self.db_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _sync_with_db_file(self):
+        """
+        Reopens the connection and drops cached results if the DB file has changed since it was opened.
+        An open connection keeps reading a deleted file, so re-querying alone would return the old data.
+        """
+        version = self._db_file_version()
+        if version == self._db_version:
+            return
+        self.conn.close()
+        self._db_version = version
+        self.conn = self._connect()
+        self._panel = None
+        self._mas_arpm = None
+
     def _execute_query(self, query: str, params=()):
-        return pd.read_sql_query(query, self.conn, params=params)
+        self._sync_with_db_file()
+        return self._read(query, params)
 
-    def get_monthly_active_supporters(self):
+    def _read(self, query: str, params=()):
+        # No sync: for methods that sync once up front and then need all their reads (and any
+        # temp tables they create) to stay on the same connection
+        chunks = pd.read_sql_query(query, self.conn, params=params, chunksize=READ_CHUNKSIZE)
+        return pd.concat(chunks, ignore_index=True)
+
+    def _load_membership_panel(self):
         """
-        Monthly Active Supporters (MAS):
-        Unique fans with an active membership in a given month.
+        Month x membership panel shared by MAS, churn and every ARPM variant.
+
+        One row per (month, membership) where the membership overlaps the month start,
+        with flags for the two activity definitions the metrics use:
+          - is_active: started on/before the month start and not ended by it (MAS, ARPM)
+          - active_at_start: started before the month start and not ended before it (churn)
+        The result is cached until the DB file changes (see _sync_with_db_file).
         """
-        query = """
-        WITH RECURSIVE months(month_start) AS (
-            SELECT date('2024-01-01')
-            UNION ALL
-            SELECT date(month_start, '+1 month')
-            FROM months
-            WHERE month_start < date('2025-06-01')
-        )
+        self._sync_with_db_file()
+        if self._panel is None:
+            self._panel = self._read(self._PANEL_QUERY)
+        return self._panel
+
+    _PANEL_QUERY = """
         SELECT
             strftime('%Y-%m', m.month_start) AS month,
-            COUNT(DISTINCT t1.fan_id) AS monthly_active_supporters
-        FROM months m
+            t1.membership_id,
+            t1.fan_id,
+            t1.creator_id,
+            t1.tier,
+            t2.category,
+            t1.monthly_price,
+            CASE
+                WHEN t1.end_date IS NULL OR t1.end_date > m.month_start THEN 1 ELSE 0
+            END AS is_active,
+            CASE
+                WHEN t1.start_date < m.month_start THEN 1 ELSE 0
+            END AS active_at_start,
+            CASE
+                WHEN t1.end_date >= m.month_start
+                 AND t1.end_date < date(m.month_start, '+1 month')
+                THEN 1 ELSE 0
+            END AS churned_in_month
+        FROM _months m
         JOIN memberships t1 ON
             t1.start_date <= m.month_start AND
-            (t1.end_date IS NULL OR t1.end_date > m.month_start)
-        GROUP BY 1
+            (t1.end_date IS NULL OR t1.end_date >= m.month_start)
+        LEFT JOIN creators t2 ON t1.creator_id = t2.creator_id
         ORDER BY 1;
         """
-        return self._execute_query(query)
+
+    @staticmethod
+    def _arpm_from_panel(panel, segment_col=None):
+        keys = ["month", segment_col] if segment_col else ["month"]
+        active = panel[panel["is_active"] == 1]
+        # Distinct (month, segment, fan) rows counted with size() instead of a per-group nunique()
+        unique_fans = active.drop_duplicates(keys + ["fan_id"])
+        arpm = pd.DataFrame(
+            {
+                "total_monthly_revenue": active.groupby(keys)["monthly_price"].sum(),
+                "monthly_active_supporters": unique_fans.groupby(keys).size(),
+            }
+        ).reset_index()
+        arpm["arpm"] = arpm["total_monthly_revenue"] / arpm["monthly_active_supporters"]
+        if segment_col:
+            arpm = arpm.rename(columns={segment_col: "segment_value"})
+        return arpm
+
+    def _mas_and_arpm(self):
+        """
+        MAS and overall ARPM come from the same reduction (month -> revenue, unique fans),
+        so it is computed once per panel and both metrics are sliced from it.
+        """
+        panel = self._load_membership_panel()
+        if self._mas_arpm is None or self._mas_arpm[0] is not panel:
+            self._mas_arpm = (panel, self._arpm_from_panel(panel))
+        return self._mas_arpm[1]
+
+    def get_monthly_active_supporters(self):
+        """
+        Monthly Active Supporters (MAS):
+        Unique fans with an active membership in a given month.
+        """
+        return self._mas_and_arpm()[["month", "monthly_active_supporters"]].copy()
 
     def get_monthly_churn_rate(self):
         """
         Monthly Churn Rate:
         (Memberships ended in month) / (Active memberships at start of month) * 100
         """
-        query = """
-        WITH RECURSIVE months(month_start) AS (
-            SELECT date('2024-02-01')
-            UNION ALL
-            SELECT date(month_start, '+1 month')
-            FROM months
-            WHERE month_start < date('2025-06-01')
-        ),
-        monthly_status AS (
-            SELECT
-                strftime('%Y-%m', m.month_start) AS month,
-                m.month_start,
-                COUNT(t1.membership_id) AS active_at_start,
-                SUM(
-                    CASE
-                        WHEN t1.end_date IS NOT NULL
-                         AND strftime('%Y-%m', t1.end_date) = strftime('%Y-%m', m.month_start)
-                        THEN 1 ELSE 0
-                    END
-                ) AS churned_in_month
-            FROM months m
-            JOIN memberships t1 ON
-                t1.start_date < m.month_start AND
-                (t1.end_date IS NULL OR t1.end_date >= m.month_start)
-            GROUP BY 1, 2
+        panel = self._load_membership_panel()
+        # The first reporting month has no prior month to churn from
+        first_month = self._months[1].strftime("%Y-%m")
+        at_start = panel[(panel["active_at_start"] == 1) & (panel["month"] >= first_month)]
+        churn = (
+            at_start.groupby("month")
+            .agg(
+                active_at_start=("membership_id", "count"),
+                churned_in_month=("churned_in_month", "sum"),
+            )
+            .reset_index()
         )
-        SELECT
-            month,
-            active_at_start,
-            churned_in_month,
-            CAST(churned_in_month AS REAL) * 100.0 / active_at_start AS monthly_churn_rate_pct
-        FROM monthly_status
-        WHERE active_at_start > 0
-        ORDER BY 1;
-        """
-        return self._execute_query(query)
+        churn["monthly_churn_rate_pct"] = churn["churned_in_month"] * 100.0 / churn["active_at_start"]
+        return churn
 
     def get_arpm(self, segment_by=None):
         """
@@ -113,8 +208,8 @@ class CreatorAnalytics:
           - 'content_type' (proxy via creator's most frequent content type)
         """
         segment_map = {
-            "creator_category": "t2.category",
-            "membership_tier": "t1.tier",
+            "creator_category": "category",
+            "membership_tier": "tier",
         }
 
         if segment_by == "content_type":
@@ -123,32 +218,10 @@ class CreatorAnalytics:
         if segment_by and segment_by not in segment_map:
             raise ValueError(f"Invalid segment_by: {segment_by}")
 
-        segment_select = f", {segment_map[segment_by]} AS segment_value" if segment_by else ""
-        segment_group = ", segment_value" if segment_by else ""
+        if segment_by is None:
+            return self._mas_and_arpm().copy()
 
-        query = f"""
-        WITH RECURSIVE months(month_start) AS (
-            SELECT date('2024-01-01')
-            UNION ALL
-            SELECT date(month_start, '+1 month')
-            FROM months
-            WHERE month_start < date('2025-06-01')
-        )
-        SELECT
-            strftime('%Y-%m', m.month_start) AS month
-            {segment_select},
-            SUM(t1.monthly_price) AS total_monthly_revenue,
-            COUNT(DISTINCT t1.fan_id) AS monthly_active_supporters,
-            SUM(t1.monthly_price) * 1.0 / COUNT(DISTINCT t1.fan_id) AS arpm
-        FROM months m
-        JOIN memberships t1 ON
-            t1.start_date <= m.month_start AND
-            (t1.end_date IS NULL OR t1.end_date > m.month_start)
-        LEFT JOIN creators t2 ON t1.creator_id = t2.creator_id
-        GROUP BY 1 {segment_group}
-        ORDER BY 1 {segment_group};
-        """
-        return self._execute_query(query)
+        return self._arpm_from_panel(self._load_membership_panel(), segment_map[segment_by])
 
     def get_arpm_by_creator_category(self):
         return self.get_arpm(segment_by="creator_category")
@@ -161,42 +234,39 @@ class CreatorAnalytics:
         ARPM segmented by content type (proxy):
         We approximate a creator's "primary content type" by their most frequent content_type.
         """
-        query = """
-        WITH creator_primary_type AS (
-            SELECT creator_id, content_type
-            FROM (
-                SELECT
-                    creator_id,
-                    content_type,
-                    COUNT(*) AS cnt,
-                    ROW_NUMBER() OVER (PARTITION BY creator_id ORDER BY COUNT(*) DESC) AS rn
-                FROM content
-                GROUP BY 1, 2
-            )
-            WHERE rn = 1
-        ),
-        months(month_start) AS (
-            SELECT date('2024-01-01')
-            UNION ALL
-            SELECT date(month_start, '+1 month')
-            FROM months
-            WHERE month_start < date('2025-06-01')
+        type_counts = self._execute_query(
+            """
+            SELECT creator_id, content_type, COUNT(*) AS cnt
+            FROM content
+            GROUP BY 1, 2;
+            """
         )
-        SELECT
-            strftime('%Y-%m', m.month_start) AS month,
-            cpt.content_type AS segment_value,
-            SUM(ms.monthly_price) AS total_monthly_revenue,
-            COUNT(DISTINCT ms.fan_id) AS monthly_active_supporters,
-            SUM(ms.monthly_price) * 1.0 / COUNT(DISTINCT ms.fan_id) AS arpm
-        FROM months m
-        JOIN memberships ms ON
-            ms.start_date <= m.month_start AND
-            (ms.end_date IS NULL OR ms.end_date > m.month_start)
-        JOIN creator_primary_type cpt ON ms.creator_id = cpt.creator_id
-        GROUP BY 1, 2
-        ORDER BY 1, 2;
+        # Most frequent type per creator: one stable sort and a first-row-per-creator pick
+        # instead of a ROW_NUMBER() window over every creator's buckets
+        creator_primary_type = (
+            type_counts.sort_values(["creator_id", "cnt"], ascending=[True, False], kind="stable")
+            .drop_duplicates("creator_id")[["creator_id", "content_type"]]
+        )
+        panel = self._load_membership_panel().merge(creator_primary_type, on="creator_id")
+        return self._arpm_from_panel(panel, "content_type")
+
+    @staticmethod
+    def _shift_months(dates, months):
+        """
+        Calendar month shift on a datetime64[s] array, matching pd.DateOffset(months=...):
+        the day of month is kept and clipped to the length of the target month.
         """
-        return self._execute_query(query)
+        days = dates.astype("datetime64[D]")
+        month = dates.astype("datetime64[M]")
+        target = month + months
+        days_in_target = (target + 1).astype("datetime64[D]") - target.astype("datetime64[D]")
+        day_of_month = days - month.astype("datetime64[D]")
+        return target.astype("datetime64[D]") + np.minimum(day_of_month, days_in_target - 1) + (dates - days)
+
+    @staticmethod
+    def _epoch_seconds(dates):
+        # Whole seconds since the epoch; flooring keeps >= / < against midnight bounds exact
+        return np.asarray(dates, dtype="datetime64[s]").astype(np.int64)
 
     def get_engagement_dropoff_prior_to_churn(self):
         """
@@ -204,7 +274,9 @@ class CreatorAnalytics:
         For each churned membership, compare engagement in the month before churn
         vs. baseline average engagement over the previous 3 months.
         """
-        churned = self._execute_query(
+        # Sync once: churned rows, the _churn_pairs temp table and the events must share a connection
+        self._sync_with_db_file()
+        churned = self._read(
             """
             SELECT membership_id, fan_id, creator_id, start_date, end_date
             FROM memberships
@@ -223,67 +295,91 @@ class CreatorAnalytics:
                 ]
             )
 
-        fan_ids = tuple(int(x) for x in churned["fan_id"].unique())
-        creator_ids = tuple(int(x) for x in churned["creator_id"].unique())
-
-        engagement_query = f"""
-        SELECT
-            e.event_id,
-            e.fan_id,
-            c.creator_id,
-            e.event_date,
-            e.event_type
-        FROM engagement_events e
-        JOIN content c ON e.content_id = c.content_id
-        WHERE e.fan_id IN {fan_ids} AND c.creator_id IN {creator_ids};
-        """
-        all_engagement = self._execute_query(engagement_query)
-        all_engagement["event_date"] = pd.to_datetime(all_engagement["event_date"])
-
-        results = []
-        for _, row in churned.iterrows():
-            churn_date = pd.to_datetime(row["end_date"])
-            fan_id = row["fan_id"]
-            creator_id = row["creator_id"]
-
-            fan_creator = all_engagement[
-                (all_engagement["fan_id"] == fan_id)
-                & (all_engagement["creator_id"] == creator_id)
-            ]
-
-            pre_churn_start = churn_date - pd.DateOffset(months=1)
-            engagement_pre_churn = fan_creator[
-                (fan_creator["event_date"] >= pre_churn_start)
-                & (fan_creator["event_date"] < churn_date)
-            ]["event_id"].count()
-
-            baseline_end = pre_churn_start
-            baseline_start = baseline_end - pd.DateOffset(months=3)
-
-            engagement_baseline = (
-                fan_creator[
-                    (fan_creator["event_date"] >= baseline_start)
-                    & (fan_creator["event_date"] < baseline_end)
-                ]["event_id"].count()
-                / 3.0
+        # Filter events to the churned (fan, creator) pairs with a join on a temp table,
+        # rather than inlining every id into the SQL text
+        try:
+            self.conn.execute(
+                """
+                CREATE TEMP TABLE _churn_pairs (
+                    fan_id INTEGER NOT NULL,
+                    creator_id INTEGER NOT NULL,
+                    PRIMARY KEY (fan_id, creator_id)
+                );
+                """
+            )
+            self._bulk_insert_temp(
+                self.conn,
+                "_churn_pairs",
+                ["fan_id", "creator_id"],
+                # One C-level conversion to Python ints instead of building a tuple per row
+                churned[["fan_id", "creator_id"]].drop_duplicates().to_numpy(np.int64).tolist(),
             )
 
-            dropoff_pct = None
-            if engagement_baseline > 0:
-                dropoff_pct = ((engagement_baseline - engagement_pre_churn) / engagement_baseline) * 100.0
-
-            results.append(
-                {
-                    "membership_id": row["membership_id"],
-                    "creator_id": creator_id,
-                    "churn_date": row["end_date"],
-                    "engagement_pre_churn": engagement_pre_churn,
-                    "engagement_baseline_avg": engagement_baseline,
-                    "dropoff_pct": dropoff_pct,
-                }
+            all_engagement = self._read(
+                """
+                SELECT
+                    e.event_id,
+                    e.fan_id,
+                    c.creator_id,
+                    e.event_date,
+                    e.event_type
+                FROM engagement_events e
+                JOIN content c ON e.content_id = c.content_id
+                JOIN _churn_pairs p ON p.fan_id = e.fan_id AND p.creator_id = c.creator_id;
+                """
             )
+        finally:
+            self.conn.execute("DROP TABLE IF EXISTS temp._churn_pairs;")
+
+        # Windows per churned membership: pre-churn is the month before churn,
+        # baseline is the 3 months before that
+        churn_date = pd.to_datetime(churned["end_date"]).to_numpy(dtype="datetime64[s]")
+        pre_churn_start = self._shift_months(churn_date, -1)
+        baseline_start = self._shift_months(pre_churn_start, -3)
+
+        # Each event becomes one int64 key: dense (fan, creator) pair code in the high bits,
+        # event time in epoch seconds in the low 32. After one sort, the events of a pair in a
+        # window [lo, hi) are the keys between searchsorted(pair|lo) and searchsorted(pair|hi).
+        n_creators = int(churned["creator_id"].max()) + 1
+        churn_pair = (
+            churned["fan_id"].to_numpy(np.int64) * n_creators + churned["creator_id"].to_numpy(np.int64)
+        )
+        event_pair = (
+            all_engagement["fan_id"].to_numpy(np.int64) * n_creators
+            + all_engagement["creator_id"].to_numpy(np.int64)
+        )
+        pairs = np.unique(churn_pair)
+        churn_code = np.searchsorted(pairs, churn_pair) << 32
+        event_keys = np.sort(
+            (np.searchsorted(pairs, event_pair) << 32)
+            | self._epoch_seconds(pd.to_datetime(all_engagement["event_date"]))
+        )
 
-        return pd.DataFrame(results)
+        def count_before(bound):
+            return np.searchsorted(event_keys, churn_code | self._epoch_seconds(bound))
+
+        before_baseline = count_before(baseline_start)
+        before_pre_churn = count_before(pre_churn_start)
+        engagement_pre_churn = count_before(churn_date) - before_pre_churn
+        engagement_baseline = (before_pre_churn - before_baseline) / 3.0
+        # Divide straight into a preallocated NaN array, only where there is a baseline to compare to
+        dropoff_pct = np.divide(
+            (engagement_baseline - engagement_pre_churn) * 100.0,
+            engagement_baseline,
+            out=np.full(len(churned), np.nan),
+            where=engagement_baseline > 0,
+        )
+
+        return pd.DataFrame(
+            {
+                "membership_id": churned["membership_id"].to_numpy(),
+                "creator_id": churned["creator_id"].to_numpy(),
+                "churn_date": churned["end_date"].to_numpy(),
+                "engagement_pre_churn": engagement_pre_churn,
+                "engagement_baseline_avg": engagement_baseline,
+                "dropoff_pct": dropoff_pct,
+            }
+        )
 
     def get_top_drivers_of_recurring_support(self):
         """
@@ -295,7 +391,7 @@ class CreatorAnalytics:
             m.creator_id,
             c.category,
             AVG(
-                julianday(CASE WHEN m.end_date IS NULL THEN date('2025-06-30') ELSE m.end_date END)
+                julianday(COALESCE(m.end_date, ?))
                 - julianday(m.start_date)
             ) AS avg_membership_duration_days,
             COUNT(m.membership_id) AS total_memberships
@@ -305,13 +401,15 @@ class CreatorAnalytics:
         ORDER BY 3 DESC
         LIMIT 10;
         """
-        top_creators = self._execute_query(creator_query)
+        # Sync once so both rankings are read from the same DB file
+        self._sync_with_db_file()
+        top_creators = self._read(creator_query, (SNAPSHOT_DATE,))
 
         tier_query = """
         SELECT
             tier,
             AVG(
-                julianday(CASE WHEN end_date IS NULL THEN date('2025-06-30') ELSE end_date END)
+                julianday(COALESCE(end_date, ?))
                 - julianday(start_date)
             ) AS avg_membership_duration_days,
             COUNT(membership_id) AS total_memberships
@@ -319,7 +417,7 @@ class CreatorAnalytics:
         GROUP BY 1
         ORDER BY 2 DESC;
         """
-        tier_perf = self._execute_query(tier_query)
+        tier_perf = self._read(tier_query, (SNAPSHOT_DATE,))
 
         return {"top_creators": top_creators, "tier_performance": tier_perf}
 
@@ -0,0 +1,17 @@
+-- Creator Support Analytics Dashboard Indexes
+-- Applied by generate_data.py after all tables are loaded, so SQLite builds
+-- each B-tree once by sorting instead of maintaining it on every insert
+
+-- Month-range joins (start_date <= month_start AND end_date > month_start);
+-- covers every memberships column the metrics panel reads
+CREATE INDEX idx_memberships_dates ON memberships (start_date, end_date, fan_id, creator_id, tier, monthly_price);
+CREATE INDEX idx_memberships_creator ON memberships (creator_id);
+
+-- Primary content type per creator (covering)
+CREATE INDEX idx_content_creator_type ON content (creator_id, content_type);
+
+-- Engagement lookups by fan and content, covering the event date (engagement drop-off before churn)
+CREATE INDEX idx_engagement_events_fan_content ON engagement_events (fan_id, content_id, event_date);
+
+-- Refresh planner statistics for metrics.py
+ANALYZE;